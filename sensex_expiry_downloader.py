@@ -1,5 +1,6 @@
 import os
 import time
+import random
 import pandas as pd
 from datetime import datetime, timezone, timedelta
 import pyotp
@@ -7,12 +8,16 @@ import sys
 import requests
 import zipfile
 import io
+import csv
+import json
+import re
 import traceback
 import logging
 import concurrent.futures
+from urllib.parse import urljoin
 from threading import Lock
 import numpy as np
-import tempfile
+from pyarrow import csv as pacsv
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
@@ -62,6 +67,7 @@ if not ANGEL_TOTP:
 # =========================================================
 sys.path.append(os.getcwd())   # <-- CRITICAL FIX
 from SmartApi.smartConnect import SmartConnect
+from SmartApi import smartExceptions
 
 # =========================================================
 # CONFIG
@@ -69,11 +75,29 @@ from SmartApi.smartConnect import SmartConnect
 API_SLEEP = 1.0
 MAX_RETRIES = 3
 MAX_WORKERS = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 16
+NON_RETRYABLE_ERRORS = {"AG8001", "AG8002", "AG8003"}   # invalid / expired / missing token
+NON_RETRYABLE_EXCEPTIONS = (smartExceptions.TokenException, smartExceptions.PermissionException)
 IST = timezone(timedelta(hours=5, minutes=30))
 
 WEEKS_FOR_RANGE = 4
 SENSEX_TOKEN = "99919000"
 SENSEX_STRIKE_MULTIPLE = 100
+SYMBOL_MASTER_CACHE_DIR = os.getenv("SYMBOL_MASTER_CACHE_DIR", "/tmp")
+
+# =========================================================
+# SHARED HTTP SESSION (connection reuse + retries)
+# =========================================================
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=MAX_WORKERS + 2,
+        max_retries=Retry(total=5, backoff_factor=2, status_forcelist=[429, 500, 502, 503]),
+    ),
+)
 
 # =========================================================
 # THREAD SAFE GLOBALS
@@ -81,7 +105,6 @@ SENSEX_STRIKE_MULTIPLE = 100
 success_list = []
 failed_list = []
 failed_details = []
-zip_lock = Lock()
 counter_lock = Lock()
 processed_counter = 0
 total_symbols = 0
@@ -112,15 +135,13 @@ def get_SENSEX_historical_data(smart_api, weeks=4):
         resp = smart_api.getCandleData(params)
 
         if resp and resp.get("status") and resp.get("data"):
-            df = pd.DataFrame(
-                resp["data"],
-                columns=["Date", "Open", "High", "Low", "Close", "Volume"]
-            )
-            df["Date"] = pd.to_datetime(df["Date"])
+            data = resp["data"]
+            lows = np.fromiter((row[3] for row in data), dtype=np.float64, count=len(data))
+            highs = np.fromiter((row[2] for row in data), dtype=np.float64, count=len(data))
             return {
-                "min_low": df["Low"].min(),
-                "max_high": df["High"].max(),
-                "current_close": df["Close"].iloc[-1]
+                "min_low": lows.min(),
+                "max_high": highs.max(),
+                "current_close": float(data[-1][4])
             }
 
     except Exception as e:
@@ -160,93 +181,214 @@ def calculate_strike_range(smart_api, buffer=1000):
 # =========================================================
 # SYMBOL MASTER
 # =========================================================
-def load_symbol_master():
+TRAILING_COMMA = re.compile(rb",(?=\r?\n)")
+
+
+class TrailingCommaReader(io.RawIOBase):
+    """Streams a text file with one trailing comma stripped from every line."""
+
+    def __init__(self, raw, chunk_size=1 << 20):
+        self._raw = raw
+        self._chunk_size = chunk_size
+        self._pending = b""   # partial last line of the previous chunk
+        self._out = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._out:
+            chunk = self._raw.read(self._chunk_size)
+            if not chunk:
+                # final line may have no newline
+                tail = self._pending
+                self._out, self._pending = tail[:-1] if tail.endswith(b",") else tail, b""
+                break
+            data = self._pending + chunk
+            cut = data.rfind(b"\n") + 1
+            self._pending = data[cut:]
+            self._out = TRAILING_COMMA.sub(b"", data[:cut])
+
+        n = min(len(b), len(self._out))
+        b[:n] = self._out[:n]
+        self._out = self._out[n:]
+        return n
+
+
+def skip_invalid_row(row):
+    logger.warning(
+        f"Skipping malformed symbol master line {row.number}: "
+        f"expected {row.expected_columns} columns, got {row.actual_columns}"
+    )
+    return "skip"
+
+
+def parse_symbol_master(f):
+    # Shoonya lines may or may not end in a trailing comma; strip one while
+    # streaming so the header and every row agree on the column count
+    reader = io.BufferedReader(TrailingCommaReader(f), buffer_size=1 << 20)
+    parse_options = pacsv.ParseOptions(invalid_row_handler=skip_invalid_row)
+    df = pacsv.read_csv(reader, parse_options=parse_options).to_pandas()
+
+    # Only SENSEX index options are ever used; drop the rest of BFO up front
+    df = df[(df["Symbol"] == "BSXOPT") & (df["Instrument"] == "OPTIDX")].reset_index(drop=True)
+    for c in ("Expiry", "Exchange"):
+        df[c] = df[c].astype("category")
+    return df
+
+
+def download_symbol_master():
     url = "https://api.shoonya.com/BFO_symbols.txt.zip"
-    r = requests.get(url, timeout=60)
+    r = SESSION.get(url, timeout=60)
     r.raise_for_status()
 
     with zipfile.ZipFile(io.BytesIO(r.content)) as z:
         with z.open(z.namelist()[0]) as f:
-            content = "\n".join(
-                line.rstrip(",") for line in f.read().decode().splitlines()
-            )
-            return pd.read_csv(io.StringIO(content))
+            return parse_symbol_master(f)
 
 
-def is_today_SENSEX_expiry(df):
-    today = datetime.now(IST).date()
-    df = df[(df["Symbol"] == "BSXOPT") & (df["Instrument"] == "OPTIDX")].copy()
-    df["ExpiryDate"] = pd.to_datetime(df["Expiry"], format="%d-%b-%Y").dt.date
-    return (today in df["ExpiryDate"].values), today
+def load_symbol_master():
+    cache = os.path.join(
+        SYMBOL_MASTER_CACHE_DIR, f"bsxopt_{datetime.now(IST).date()}.parquet"
+    )
+    if os.path.exists(cache):
+        try:
+            df = pd.read_parquet(cache)
+            logger.info(f"Using cached symbol master: {cache}")
+            return df
+        except Exception as e:
+            logger.warning(f"Discarding unreadable symbol master cache {cache}: {e}")
+            try:
+                os.remove(cache)
+            except OSError:
+                pass
+
+    df = download_symbol_master()
+    tmp = cache + ".tmp"
+    try:
+        os.makedirs(SYMBOL_MASTER_CACHE_DIR, exist_ok=True)
+        # write-then-rename so an interrupted run never leaves a partial cache
+        df.to_parquet(tmp, engine="pyarrow", compression="zstd")
+        os.replace(tmp, cache)
+    except Exception as e:
+        logger.warning(f"Symbol master cache write failed: {e}")
+    return df
 
 
-def get_option_symbols(df, expiry_date, start, end):
-    expiry = expiry_date.strftime("%d-%b-%Y").upper()
-    df = df[
-        (df["Symbol"] == "BSXOPT") &
-        (df["Instrument"] == "OPTIDX") &
-        (df["Expiry"] == expiry)
-    ].copy()
+def prepare_SENSEX_options(df_bsx):
+    # Keep whole-number strikes only and store them as int64 for integer filtering
+    sp = pd.to_numeric(df_bsx["StrikePrice"], errors="coerce")
+    ok = (sp % 1 == 0).to_numpy()
+    df_bsx = df_bsx[ok].reset_index(drop=True)
+    df_bsx["StrikePrice"] = sp[ok].astype(np.int64).to_numpy()
 
-    df["StrikePrice"] = pd.to_numeric(df["StrikePrice"], errors="coerce")
+    # Parse each distinct Expiry string once, then broadcast via category codes
+    expiry = df_bsx["Expiry"].cat
+    parsed = pd.to_datetime(expiry.categories, format="%d-%b-%Y").values.astype("datetime64[D]")
+    parsed = np.append(parsed, np.datetime64("NaT", "D"))   # code -1 -> NaT
+    expiry64 = np.ascontiguousarray(parsed[expiry.codes.to_numpy()])
+    return df_bsx, expiry64
 
-    return df[
-        (df["StrikePrice"] >= start) &
-        (df["StrikePrice"] <= end) &
-        (df["StrikePrice"] % 100 == 0)
+
+def is_today_SENSEX_expiry(expiry64):
+    today = datetime.now(IST).date()
+    return bool((expiry64 == np.datetime64(today, "D")).any()), today
+
+
+def get_option_symbols(df_bsx, expiry64, expiry_date, start, end):
+    sp = df_bsx["StrikePrice"].to_numpy()
+    return df_bsx[
+        (expiry64 == np.datetime64(expiry_date, "D")) &
+        (sp >= int(start)) &
+        (sp <= int(end)) &
+        (sp % 100 == 0)
     ]
 
 
 # =========================================================
-# TELEGRAM UPLOAD (UNCHANGED LOGIC)
+# TELEGRAM UPLOAD (streamed from in-memory zip)
 # =========================================================
-def send_zip_to_telegram(zip_bytes, name):
+def send_zip_to_telegram(zip_buf, name):
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendDocument"
 
-    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        tmp.write(zip_bytes)
-        path = tmp.name
-
     try:
-        session = requests.Session()
-        retries = Retry(total=5, backoff_factor=2, status_forcelist=[429,500,502,503])
-        session.mount("https://", HTTPAdapter(max_retries=retries))
-
-        with open(path, "rb") as f:
-            r = session.post(
-                url,
-                data={"chat_id": TELEGRAM_CHAT_ID},
-                files={"document": (name, f)},
-                timeout=(30, 600),
-            )
+        zip_buf.seek(0)
+        r = SESSION.post(
+            url,
+            data={"chat_id": TELEGRAM_CHAT_ID},
+            files={"document": (name, zip_buf, "application/zip")},
+            timeout=(30, 600),
+        )
         r.raise_for_status()
         return True
     except Exception as e:
         logger.error(f"Telegram error: {e}")
         return False
-    finally:
-        os.remove(path)
 
 
 # =========================================================
 # CANDLE DOWNLOAD
 # =========================================================
+def candles_to_csv(candles):
+    out = io.StringIO()
+    w = csv.writer(out, lineterminator="\n")
+    w.writerow(["Date", "Open", "High", "Low", "Close", "Volume"])
+    # "2024-01-01T09:15:00+05:30" -> "2024-01-01 09:15:00"
+    w.writerows((row[0][:19].replace("T", " "), *row[1:]) for row in candles)
+    return out.getvalue().encode()
+
+
+def fetch_candles(smart, params):
+    # Angel has no multi-token candle endpoint, and SmartConnect sends every
+    # call through bare `requests.request`, so post via the pooled SESSION to
+    # keep one TLS connection alive across the per-token calls
+    headers = smart.requestHeaders()
+    headers["Authorization"] = f"Bearer {smart.access_token}"
+    r = SESSION.post(
+        urljoin(smart.root, smart._routes["api.candle.data"]),
+        data=json.dumps(params),
+        headers=headers,
+        timeout=smart.timeout,
+    )
+    data = r.json()
+
+    # mirror SmartConnect's mapping of API errors onto its exception types
+    if data.get("error_type"):
+        exc = getattr(smartExceptions, data["error_type"], smartExceptions.GeneralException)
+        raise exc(data.get("message"), code=r.status_code)
+    return data
+
+
+def backoff_sleep(attempt):
+    time.sleep(min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)) + random.random() * 0.5)
+
+
 def get_candles_with_retry(smart, params):
+    token = params["symboltoken"]
     for i in range(MAX_RETRIES):
+        attempt = f"token {token} attempt {i + 1}/{MAX_RETRIES}"
         try:
-            r = smart.getCandleData(params)
+            r = fetch_candles(smart, params)
             if r and r.get("status"):
                 return r
-            time.sleep((i + 1) * 5)
-        except:
-            time.sleep((i + 1) * 5)
+            # the gateway uses camelCase errorCode, the SDK payloads errorcode
+            code = (r or {}).get("errorcode") or (r or {}).get("errorCode")
+            if code in NON_RETRYABLE_ERRORS:
+                logger.error(f"Candle request rejected ({attempt}): {code} {r.get('message')}")
+                return None
+            logger.warning(f"Candle request failed ({attempt}): {code} {(r or {}).get('message')}")
+        except NON_RETRYABLE_EXCEPTIONS as e:
+            logger.error(f"Candle request rejected ({attempt}): {type(e).__name__} {e}")
+            return None
+        except Exception as e:
+            logger.warning(f"Candle request error ({attempt}): {type(e).__name__} {e}")
+        if i < MAX_RETRIES - 1:
+            backoff_sleep(i)
     return None
 
 
 def download_symbol(args):
-    smart, row, FROM, TO = args
-    symbol = row["TradingSymbol"]
-    token = str(row["Token"])
+    smart, symbol, token, FROM, TO = args
 
     params = {
         "exchange": "BFO",
@@ -258,15 +400,7 @@ def download_symbol(args):
 
     r = get_candles_with_retry(smart, params)
     if r and r.get("data"):
-        df = pd.DataFrame(
-            r["data"],
-            columns=["Date","Open","High","Low","Close","Volume"]
-        )
-        df["Date"] = pd.to_datetime(df["Date"])
-        buf = io.BytesIO()
-        with pd.ExcelWriter(buf, engine="openpyxl") as w:
-            df.to_excel(w, index=False)
-        return symbol, buf.getvalue(), None
+        return symbol, r["data"], None
 
     return symbol, None, "No data"
 
@@ -282,37 +416,39 @@ def main():
         raise RuntimeError("Login failed")
 
     df_master = load_symbol_master()
-    is_expiry, expiry = is_today_SENSEX_expiry(df_master)
+    df_bsx, expiry64 = prepare_SENSEX_options(df_master)
+    is_expiry, expiry = is_today_SENSEX_expiry(expiry64)
     if not is_expiry:
         logger.info("Not SENSEX expiry day. Exiting.")
         sys.exit(0)
 
     start, end = calculate_strike_range(smart)
-    df = get_option_symbols(df_master, expiry, start, end)
+    df = get_option_symbols(df_bsx, expiry64, expiry, start, end)
 
     FROM = (expiry - timedelta(days=90)).strftime("%Y-%m-%d 09:15")
     TO = expiry.strftime("%Y-%m-%d 15:30")
 
-    zip_buf = io.BytesIO()
-    with zipfile.ZipFile(zip_buf, "w") as zf:
-        pass
+    syms = df["TradingSymbol"].to_numpy()
+    toks = df["Token"].astype(str).to_numpy()
+    args = [(smart, s, t, FROM, TO) for s, t in zip(syms, toks)]
 
-    args = [(smart, r, FROM, TO) for _, r in df.iterrows()]
-
-    with concurrent.futures.ThreadPoolExecutor(MAX_WORKERS) as ex:
-        for symbol, data, err in ex.map(download_symbol, args):
-            if data:
-                with zipfile.ZipFile(zip_buf, "a") as zf:
-                    zf.writestr(f"{symbol}.xlsx", data)
-                success_list.append(symbol)
-            else:
-                failed_list.append(symbol)
-                failed_details.append((symbol, err))
+    zip_buf = io.BytesIO()
+    with zipfile.ZipFile(zip_buf, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        with concurrent.futures.ThreadPoolExecutor(MAX_WORKERS) as ex:
+            futures = [ex.submit(download_symbol, a) for a in args]
+            for fut in concurrent.futures.as_completed(futures):
+                # Workers only fetch; serialization stays on this single consumer
+                symbol, candles, err = fut.result()
+                if candles:
+                    zf.writestr(f"{symbol}.csv", candles_to_csv(candles))
+                    success_list.append(symbol)
+                else:
+                    failed_list.append(symbol)
+                    failed_details.append((symbol, err))
 
     if success_list:
-        zip_buf.seek(0)
         send_zip_to_telegram(
-            zip_buf.read(),
+            zip_buf,
             f"SENSEX_expiry_{expiry.strftime('%d%m%y')}_1min.zip"
         )
 
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The downloader validates credentials at import time
+os.environ.setdefault("ANGEL_API_KEY", "test")
+os.environ.setdefault("ANGEL_CLIENT_ID", "test")
+os.environ.setdefault("ANGEL_PIN", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,133 @@
+import json
+
+import pytest
+import requests
+from SmartApi import smartExceptions
+from SmartApi.smartConnect import SmartConnect
+
+import sensex_expiry_downloader as dl
+
+
+class FakeSmart:
+    root = SmartConnect._rootUrl
+    _routes = SmartConnect._routes
+    access_token = "jwt"
+    timeout = 7
+
+    def requestHeaders(self):
+        return {"Content-type": "application/json", "Accept": "application/json"}
+
+
+@pytest.fixture
+def angel(monkeypatch):
+    """Serve candle responses from the pooled SESSION adapter and record requests."""
+    state = {"sent": [], "payload": {"status": True, "data": []}, "status": 200}
+    adapter = dl.SESSION.get_adapter(SmartConnect._rootUrl)
+
+    def send(request, **kwargs):
+        state["sent"].append(request)
+        r = requests.Response()
+        r.status_code = state["status"]
+        r._content = json.dumps(state["payload"]).encode()
+        r.request = request
+        r.url = request.url
+        return r
+
+    def bare_request(*args, **kwargs):
+        raise AssertionError("candle call bypassed the shared session")
+
+    monkeypatch.setattr(adapter, "send", send)
+    monkeypatch.setattr(requests, "request", bare_request)
+    return state
+
+
+def test_fetch_candles_posts_through_shared_session(angel):
+    params = {"exchange": "BFO", "symboltoken": "1001", "interval": "ONE_MINUTE"}
+
+    for _ in range(2):
+        assert dl.fetch_candles(FakeSmart(), params) == {"status": True, "data": []}
+
+    assert len(angel["sent"]) == 2
+    req = angel["sent"][0]
+    assert req.method == "POST"
+    assert req.url == SmartConnect._rootUrl + SmartConnect._routes["api.candle.data"]
+    assert req.headers["Authorization"] == "Bearer jwt"
+    assert json.loads(req.body) == params
+
+
+def test_fetch_candles_raises_sdk_exception_for_error_type(angel):
+    angel["payload"] = {"error_type": "TokenException", "message": "Invalid Token"}
+    angel["status"] = 403
+
+    with pytest.raises(smartExceptions.TokenException):
+        dl.fetch_candles(FakeSmart(), {"symboltoken": "1001"})
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(dl, "backoff_sleep", lambda attempt: None)
+
+
+def scripted(monkeypatch, outcomes):
+    calls = []
+
+    def fake_fetch(smart, params):
+        calls.append(params)
+        outcome = outcomes[len(calls) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(dl, "fetch_candles", fake_fetch)
+    return calls
+
+
+@pytest.mark.parametrize("payload", [
+    {"status": False, "errorcode": "AG8001", "message": "Invalid Token"},
+    {"success": False, "errorCode": "AG8002", "message": "Token Expired"},
+])
+def test_retry_stops_on_auth_error_codes(monkeypatch, no_sleep, payload):
+    calls = scripted(monkeypatch, [payload] * dl.MAX_RETRIES)
+
+    assert dl.get_candles_with_retry(None, {"symboltoken": "1001"}) is None
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("exc", [
+    smartExceptions.TokenException("Invalid Token", code=403),
+    smartExceptions.PermissionException("Forbidden", code=403),
+])
+def test_retry_stops_on_auth_exceptions(monkeypatch, no_sleep, exc):
+    calls = scripted(monkeypatch, [exc] * dl.MAX_RETRIES)
+
+    assert dl.get_candles_with_retry(None, {"symboltoken": "1001"}) is None
+    assert len(calls) == 1
+
+
+def test_retry_recovers_from_transient_errors(monkeypatch, no_sleep):
+    ok = {"status": True, "data": [["2024-01-01T09:15:00+05:30", 1, 2, 0.5, 1.5, 10]]}
+    calls = scripted(monkeypatch, [
+        requests.Timeout("read timed out"),
+        {"status": False, "errorcode": "AB1004", "message": "Something went wrong"},
+        ok,
+    ])
+
+    assert dl.get_candles_with_retry(None, {"symboltoken": "1001"}) is ok
+    assert len(calls) == 3
+
+
+def test_candles_to_csv_pins_output_format():
+    candles = [
+        ["2024-12-06T09:15:00+05:30", 120.5, 125.0, 118.25, 121.0, 1500],
+        ["2024-12-06T09:16:00+05:30", 121.0, 121.0, 119.0, 119.5, 0],
+    ]
+
+    assert dl.candles_to_csv(candles) == (
+        b"Date,Open,High,Low,Close,Volume\n"
+        b"2024-12-06 09:15:00,120.5,125.0,118.25,121.0,1500\n"
+        b"2024-12-06 09:16:00,121.0,121.0,119.0,119.5,0\n"
+    )
+
+
+def test_candles_to_csv_empty_has_header_only():
+    assert dl.candles_to_csv([]) == b"Date,Open,High,Low,Close,Volume\n"
@@ -0,0 +1,88 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sensex_expiry_downloader as dl
+
+
+def master(rows):
+    """Build a master frame shaped like parse_symbol_master's output."""
+    df = pd.DataFrame(rows, columns=["TradingSymbol", "Expiry", "StrikePrice"])
+    df["Expiry"] = df["Expiry"].astype("category")
+    return df
+
+
+@pytest.fixture
+def options():
+    return dl.prepare_SENSEX_options(master([
+        ("S84900CE", "06-DEC-2024", 84900.0),
+        ("S85000CE", "06-DEC-2024", 85000.0),
+        ("S85050CE", "06-DEC-2024", 85050.0),
+        ("S85000.5CE", "06-DEC-2024", 85000.5),
+        ("SNANCE", "06-DEC-2024", np.nan),
+        ("S85100CE", "06-DEC-2024", 85100.0),
+        ("S85200CE", "13-DEC-2024", 85200.0),
+        ("SNOEXPCE", None, 85300.0),
+    ]))
+
+
+def test_prepare_drops_nan_and_fractional_strikes(options):
+    df, expiry64 = options
+
+    assert df["StrikePrice"].dtype == np.int64
+    assert df["TradingSymbol"].tolist() == [
+        "S84900CE", "S85000CE", "S85050CE", "S85100CE", "S85200CE", "SNOEXPCE",
+    ]
+    assert len(expiry64) == len(df)
+
+
+def test_prepare_parses_expiry_via_category_codes(options):
+    _, expiry64 = options
+
+    assert expiry64.dtype == np.dtype("datetime64[D]")
+    assert expiry64.flags["C_CONTIGUOUS"]
+    assert expiry64[:4].tolist() == [dt.date(2024, 12, 6)] * 4
+    assert expiry64[4] == np.datetime64("2024-12-13")
+    assert np.isnat(expiry64[5])   # missing Expiry -> code -1 -> NaT
+
+
+def frozen_now(day):
+    class FrozenDatetime(dt.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls(day.year, day.month, day.day, 9, 0, tzinfo=tz)
+
+    return FrozenDatetime
+
+
+@pytest.mark.parametrize("today, expected", [
+    (dt.date(2024, 12, 13), True),
+    (dt.date(2024, 12, 9), False),
+])
+def test_is_today_SENSEX_expiry(monkeypatch, options, today, expected):
+    _, expiry64 = options
+    monkeypatch.setattr(dl, "datetime", frozen_now(today))
+
+    assert dl.is_today_SENSEX_expiry(expiry64) == (expected, today)
+
+
+def test_get_option_symbols_filters_expiry_range_and_multiple(options):
+    df, expiry64 = options
+
+    out = dl.get_option_symbols(df, expiry64, dt.date(2024, 12, 6), 84900, 85100)
+
+    assert out["TradingSymbol"].tolist() == ["S84900CE", "S85000CE", "S85100CE"]
+
+
+def test_get_option_symbols_accepts_float_bounds(options):
+    df, expiry64 = options
+
+    # calculate_strike_range can hand back numpy floats
+    out = dl.get_option_symbols(
+        df, expiry64, dt.date(2024, 12, 6), np.float64(85000.0), np.float64(85100.0)
+    )
+
+    assert out["StrikePrice"].tolist() == [85000, 85100]
+    assert out["StrikePrice"].dtype == np.int64
@@ -0,0 +1,86 @@
+import io
+
+import pandas as pd
+import pytest
+
+import sensex_expiry_downloader as dl
+
+HEADER = "Exchange,Token,LotSize,Symbol,TradingSymbol,Expiry,Instrument,OptionType,StrikePrice,TickSize"
+ROWS = [
+    "BFO,1001,20,BSXOPT,SENSEX85000CE,06-DEC-2024,OPTIDX,CE,85000,0.05",
+    "BFO,1002,20,BSXOPT,SENSEX85000PE,06-DEC-2024,OPTIDX,PE,85000,0.05",
+    "BFO,2001,15,BANKEX,BANKEX24DECFUT,30-DEC-2024,FUTIDX,XX,-1,0.05",
+]
+
+
+def build(header_comma, row_comma, newline="\n", final_newline=True):
+    lines = [HEADER + ("," if header_comma else "")]
+    lines += [row + ("," if row_comma else "") for row in ROWS]
+    text = newline.join(lines) + (newline if final_newline else "")
+    return io.BytesIO(text.encode())
+
+
+@pytest.mark.parametrize("header_comma", [True, False])
+@pytest.mark.parametrize("row_comma", [True, False])
+def test_parse_symbol_master_tolerates_trailing_commas(header_comma, row_comma):
+    df = dl.parse_symbol_master(build(header_comma, row_comma))
+
+    assert list(df.columns) == HEADER.split(",")
+    assert df["TradingSymbol"].tolist() == ["SENSEX85000CE", "SENSEX85000PE"]
+    assert df["StrikePrice"].tolist() == [85000, 85000]
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_parse_symbol_master_mixed_rows_and_no_final_newline(newline):
+    text = newline.join([HEADER + ",", ROWS[0], ROWS[1] + ",", ROWS[2]])
+    df = dl.parse_symbol_master(io.BytesIO(text.encode()))
+
+    assert df["Token"].tolist() == [1001, 1002]
+    assert df["TickSize"].tolist() == [0.05, 0.05]
+
+
+@pytest.mark.parametrize("final_newline", [True, False])
+def test_parse_symbol_master_keeps_empty_last_field(final_newline):
+    empty_tick = ROWS[1].rsplit(",", 1)[0] + ","
+    text = "\n".join([HEADER + ",", ROWS[0] + ",", empty_tick + ","])
+    df = dl.parse_symbol_master(io.BytesIO((text + ("\n" if final_newline else "")).encode()))
+
+    assert df["Token"].tolist() == [1001, 1002]
+    assert df["TickSize"].iloc[0] == 0.05
+    assert pd.isna(df["TickSize"].iloc[1])
+
+
+def test_parse_symbol_master_skips_malformed_rows():
+    text = "\n".join([HEADER, ROWS[0], ROWS[1] + ",extra,fields", "BFO,3001", ROWS[2]])
+    df = dl.parse_symbol_master(io.BytesIO(text.encode()))
+
+    assert df["Token"].tolist() == [1001]
+
+
+def test_trailing_comma_reader_handles_chunk_boundaries():
+    raw = build(header_comma=True, row_comma=True).getvalue()
+    reader = dl.TrailingCommaReader(io.BytesIO(raw), chunk_size=7)
+
+    assert reader.read() == raw.replace(b",\n", b"\n")
+
+
+def test_trailing_comma_reader_strips_only_one_comma():
+    reader = dl.TrailingCommaReader(io.BytesIO(b"a,b,,\nc,,\r\nd,,"), chunk_size=3)
+
+    assert reader.read() == b"a,b,\nc,\r\nd,"
+
+
+def test_load_symbol_master_recovers_from_corrupt_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(dl, "SYMBOL_MASTER_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(
+        dl, "download_symbol_master",
+        lambda: dl.parse_symbol_master(build(header_comma=True, row_comma=True)),
+    )
+    cache = tmp_path / f"bsxopt_{dl.datetime.now(dl.IST).date()}.parquet"
+    cache.write_bytes(b"PAR1 truncated")
+
+    df = dl.load_symbol_master()
+
+    assert df["TradingSymbol"].tolist() == ["SENSEX85000CE", "SENSEX85000PE"]
+    assert dl.load_symbol_master()["Token"].tolist() == [1001, 1002]
+    assert [p.name for p in tmp_path.iterdir()] == [cache.name]